@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import os
 
 # 1. CONFIGURACIÓN DE LA PÁGINA
@@ -9,37 +11,196 @@ st.set_page_config(page_title="Visor Inmobiliario España", layout="wide")
 # ------------------------------------------------------
 # 2. FUNCIÓN DE CARGA DE DATOS (LECTURA DIRECTA)
 # ------------------------------------------------------
-@st.cache_data
+def tipo_pandas(tipo_arrow):
+    # Las medidas y el año/trimestre se quedan en memoria Arrow (ArrowDtype),
+    # así las operaciones sobre ellas usan los kernels de pyarrow. Los textos
+    # codificados (geo, ca, prv) se convierten a category de pandas: Plotly
+    # no sabe agrupar la leyenda con columnas diccionario de Arrow
+    if pa.types.is_dictionary(tipo_arrow):
+        return None
+    return pd.ArrowDtype(tipo_arrow)
+
+# cache_resource devuelve siempre el mismo objeto en memoria, sin copiarlo ni
+# serializarlo en cada recarga (el DataFrame solo se lee, nunca se modifica)
+@st.cache_resource
 def load_data(file_path):
     # Verificamos si el archivo existe en el repositorio
     if not os.path.exists(file_path):
         st.error(f"No se encontró el archivo '{file_path}' en el repositorio.")
         return None
 
-    # Leemos el CSV con el formato español (punto y coma y decimales con coma)
-    df = pd.read_csv(file_path, sep=';', decimal=',', encoding='utf-8')
-    
-    # Normalizar nombres de columnas
-    df.columns = df.columns.str.strip()
+    # datos.parquet (generado con convertir_datos.py) ya contiene solo las
+    # columnas que usa la aplicación, con sus tipos fijados. El archivo se
+    # mapea en memoria, así el sistema lo sirve desde su caché de páginas sin
+    # copiarlo con llamadas a read()
+    tabla = pq.read_table(file_path, memory_map=True)
+    df = tabla.to_pandas(types_mapper=tipo_pandas)
     
     # Crear una columna de FECHA real para los gráficos
     df['mes_aprox'] = df['trim'] * 3
-    df['periodo_dt'] = pd.to_datetime(df['ano'].astype(str) + '-' + df['mes_aprox'].astype(str) + '-01')
-    
-    # Etiqueta legible
-    df['periodo_lbl'] = df['ano'].astype(str) + "-T" + df['trim'].astype(str)
+    df['periodo_dt'] = pd.to_datetime(pd.DataFrame({'year': df['ano'], 'month': df['mes_aprox'], 'day': 1}))
     
+    # Etiqueta legible: como solo hay 4 trimestres por año, generamos la lista
+    # de etiquetas posibles una vez y cada fila guarda solo su posición en ella
+    ano_min, ano_max = int(df['ano'].min()), int(df['ano'].max())
+    # Guardamos el rango con el DataFrame para no recalcularlo en cada recarga
+    df.attrs['rango_anos'] = (ano_min, ano_max)
+    etiquetas = [f"{a}-T{t}" for a in range(ano_min, ano_max + 1) for t in range(1, 5)]
+    codigos = (df['ano'].to_numpy(dtype='int16') - ano_min) * 4 + (df['trim'].to_numpy(dtype='int16') - 1)
+    df['periodo_lbl'] = pd.Categorical.from_codes(codigos, categories=etiquetas, ordered=True)
+
+    # Código entero del trimestre para ordenar por fecha con una sola clave
+    df['periodo_cod'] = (df['ano'].astype('int16') * 4 + df['trim']).astype('int16')
+
     return df
 
+# Columna que identifica cada lugar según el nivel geográfico
+COLUMNA_LUGAR = {'Comunidad': 'ca', 'Provincia': 'prv'}
+
+@st.cache_resource
+def calcular_particiones(_df, clave_df):
+    # Separamos el DataFrame por nivel geográfico una sola vez. Cada parte se
+    # indexa y ordena por (lugar, año, trimestre) para que los filtros de la
+    # barra lateral sean cortes con .loc en lugar de recorrer todas las filas
+    particiones = {}
+    for nivel in _df['geo'].unique():
+        df_nivel = _df[_df['geo'] == nivel]
+        claves = ['ano', 'trim']
+        if nivel in COLUMNA_LUGAR:
+            claves = [COLUMNA_LUGAR[nivel]] + claves
+        particiones[nivel] = df_nivel.set_index(claves, drop=False).sort_index()
+    return particiones
+
+@st.cache_resource(max_entries=64)
+def filtrar(_particiones, clave_df, nivel, seleccion, years):
+    # Resultado del filtro de la barra lateral. Se guarda por combinación de
+    # filtros para que las recargas que no los cambian (tipo de activo,
+    # pestañas...) reutilicen el mismo DataFrame sin volver a copiar datos.
+    # La partición ya está ordenada por su índice, así que filtrar es un corte.
+    # El resultado se devuelve con los trimestres más recientes primero, como
+    # se muestra en la tabla (los gráficos reordenan al agrupar)
+    df_nivel = _particiones[nivel]
+    rango = slice(years[0], years[1])
+    if seleccion is None:
+        df_filtered = df_nivel.loc[rango]
+    else:
+        df_filtered = df_nivel.loc[(list(seleccion), rango), :]
+    df_filtered = df_filtered.sort_values('periodo_cod', ascending=False, kind='stable')
+    return df_filtered.reset_index(drop=True)
+
+@st.cache_resource
+def calcular_listas(_df, clave_df):
+    # Listas para los selectores de la barra lateral. El guion bajo de _df
+    # evita que Streamlit calcule el hash del DataFrame: la caché se indexa
+    # por clave_df (el id del DataFrame devuelto por load_data)
+    return {
+        'niveles_geo': list(_df['geo'].unique()),
+        'Comunidad': sorted(_df.loc[_df['geo'] == 'Comunidad', 'ca'].unique()),
+        'Provincia': sorted(_df.loc[_df['geo'] == 'Provincia', 'prv'].unique()),
+        'rango_anos': tuple(_df.attrs['rango_anos']),
+    }
+
+# Máximo de puntos por línea: por encima se reduce la serie con LTTB
+MAX_PUNTOS_SERIE = 1500
+
+def lttb(df_serie, col_x, col_y, n_puntos):
+    # Largest-Triangle-Three-Buckets: conserva el primer y el último punto y,
+    # de cada tramo intermedio, el que forma el triángulo de mayor área con el
+    # punto elegido antes y la media del tramo siguiente
+    n = len(df_serie)
+    if n <= n_puntos or n_puntos < 3:
+        return df_serie
+
+    x = df_serie[col_x].to_numpy().astype('int64').astype('float64')
+    y = df_serie[col_y].to_numpy(dtype='float64')
+    bordes = np.linspace(1, n - 1, n_puntos - 1).astype('int64')
+
+    indices = [0]
+    a = 0
+    for i in range(n_puntos - 2):
+        ini, fin = bordes[i], bordes[i + 1]
+        if i + 2 < len(bordes):
+            x_sig = x[fin:bordes[i + 2]].mean()
+            y_sig = y[fin:bordes[i + 2]].mean()
+        else:
+            x_sig, y_sig = x[n - 1], y[n - 1]
+        areas = np.abs((x[a] - x_sig) * (y[ini:fin] - y[a]) - (x[a] - x[ini:fin]) * (y_sig - y[a]))
+        a = ini + int(areas.argmax())
+        indices.append(a)
+    indices.append(n - 1)
+    return df_serie.iloc[indices]
+
+def datos_grafico(df_filtered, col_y, color_col, agregacion):
+    # Para el gráfico solo hacen falta la fecha, la medida y la leyenda
+    claves = ([color_col] if color_col else []) + ['periodo_dt']
+
+    # Operaciones e importes se guardan en float32, pero Plotly los enviaría al
+    # navegador como Float32Array, que plotly.js limpia punto a punto antes de
+    # dibujar. Para el gráfico los pasamos a float64 (los precios ya lo son)
+    df_plot = df_filtered[claves + [col_y]].astype({col_y: 'float64'})
+
+    # Un único punto por lugar y trimestre: si hubiera filas repetidas se
+    # agregan ('sum' para operaciones, 'mean' para precios). observed=True
+    # evita generar todas las combinaciones de las categorías de la leyenda.
+    # min_count=1 deja en NaN un trimestre sin datos (hueco en la línea) en
+    # lugar de dibujarlo como 0 operaciones
+    grupos = df_plot.groupby(claves, observed=True, as_index=False)[col_y]
+    if agregacion == 'sum':
+        df_plot = grupos.sum(min_count=1)
+    else:
+        df_plot = grupos.agg(agregacion)
+
+    # Si alguna línea supera MAX_PUNTOS_SERIE la reducimos con LTTB. LTTB
+    # necesita cada serie en orden cronológico: lo garantiza el groupby
+    # anterior, que ordena por (leyenda, periodo_dt); df_filtered llega con
+    # los trimestres más recientes primero
+    if color_col is None:
+        df_plot = lttb(df_plot, 'periodo_dt', col_y, MAX_PUNTOS_SERIE)
+    elif df_plot.groupby(color_col, observed=True).size().max() > MAX_PUNTOS_SERIE:
+        df_plot = pd.concat([
+            lttb(serie, 'periodo_dt', col_y, MAX_PUNTOS_SERIE)
+            for _, serie in df_plot.groupby(color_col, observed=True, sort=False)
+        ])
+    return df_plot
+
+@st.cache_resource
+def cargar_plotly():
+    # plotly.express tarda en importarse: solo se carga al dibujar el primer
+    # gráfico y no al arrancar la aplicación
+    import plotly.express as px
+    return px
+
+@st.cache_data(max_entries=64)
+def grafico_lineas(_df_filtered, clave_filtro, col_y, color_col, agregacion, titulo, etiqueta_y, modo_render):
+    # Construir la figura de Plotly cuesta varias decenas de ms. Se guarda por
+    # estado de los filtros (clave_filtro) y por medida, así las recargas que
+    # no cambian nada reutilizan la figura ya construida
+    px = cargar_plotly()
+    fig = px.line(
+        datos_grafico(_df_filtered, col_y, color_col, agregacion),
+        x='periodo_dt',
+        y=col_y,
+        color=color_col,
+        title=titulo,
+        labels={col_y: etiqueta_y, 'periodo_dt': 'Fecha'},
+        markers=True,
+        template="plotly_white",
+        render_mode=modo_render
+    )
+    return fig
+
 # ------------------------------------------------------
 # 3. PROCESO DE CARGA AUTOMÁTICA
 # ------------------------------------------------------
 # Nombre del archivo tal cual está en tu GitHub
-NOMBRE_ARCHIVO = "datos.csv"
+NOMBRE_ARCHIVO = "datos.parquet"
 
 df = load_data(NOMBRE_ARCHIVO)
 
 if df is not None:
+    listas = calcular_listas(df, id(df))
+    particiones = calcular_particiones(df, id(df))
+
     st.title("🏙️ Análisis Inmobiliario (2007-2025)")
     
     # --- BARRA LATERAL (FILTROS) ---
@@ -54,32 +215,32 @@ if df is not None:
     prefijo = {'Vivienda': 'viv', 'Garaje': 'gar', 'Trastero': 'tras'}[tipo_producto]
     
     # B. Selector de Nivel Geográfico
-    niveles_geo = df['geo'].unique()
+    niveles_geo = listas['niveles_geo']
     nivel_seleccionado = st.sidebar.selectbox("Nivel Geográfico", niveles_geo, index=0)
     
-    df_nivel = df[df['geo'] == nivel_seleccionado]
-    
     # C. Selector de Lugar Específico
     if nivel_seleccionado == 'Nacional':
-        df_filtered = df_nivel
+        seleccion = None
         st.sidebar.info("Mostrando datos totales de España")
     
     elif nivel_seleccionado == 'Comunidad':
-        lista_lugares = sorted(df_nivel['ca'].unique())
+        lista_lugares = listas['Comunidad']
         seleccion = st.sidebar.multiselect("Selecciona CC.AA.", lista_lugares, default=lista_lugares[:2])
-        df_filtered = df_nivel[df_nivel['ca'].isin(seleccion)]
         
     else: # Provincia
-        lista_lugares = sorted(df_nivel['prv'].unique())
+        lista_lugares = listas['Provincia']
         # Intentamos pre-seleccionar Madrid y Barcelona si existen
         default_provincias = [p for p in ['Madrid', 'Barcelona'] if p in lista_lugares]
         seleccion = st.sidebar.multiselect("Selecciona Provincias", lista_lugares, default=default_provincias if default_provincias else lista_lugares[:1])
-        df_filtered = df_nivel[df_nivel['prv'].isin(seleccion)]
 
     # D. Rango de Fechas
-    min_year, max_year = int(df['ano'].min()), int(df['ano'].max())
+    min_year, max_year = listas['rango_anos']
     years = st.sidebar.slider("Rango de Años", min_year, max_year, (min_year, max_year))
-    df_filtered = df_filtered[(df_filtered['ano'] >= years[0]) & (df_filtered['ano'] <= years[1])]
+    clave_filtro = (
+        id(df), nivel_seleccionado,
+        tuple(seleccion) if seleccion is not None else None, tuple(years)
+    )
+    df_filtered = filtrar(particiones, *clave_filtro)
 
     # ------------------------------------------------------
     # 4. VISUALIZACIONES
@@ -94,37 +255,31 @@ if df is not None:
 
     tab1, tab2, tab3 = st.tabs(["🔢 Volumen de Ventas", "💰 Precio por m²", "📋 Tabla de Datos"])
 
+    # Las líneas se dibujan con WebGL (trazas scattergl): con muchas provincias
+    # hay miles de puntos y el SVG va lento en el navegador. Para selecciones
+    # pequeñas (menos de ~1000 puntos) 'svg' puede ser algo más rápido
+    modo_render = 'webgl'
+
     with tab1:
-        fig1 = px.line(
-            df_filtered, 
-            x='periodo_dt', 
-            y=col_num, 
-            color=color_col,
-            title=f"Número de compraventas de {tipo_producto}s",
-            labels={col_num: 'Nº Operaciones', 'periodo_dt': 'Fecha'},
-            markers=True,
-            template="plotly_white"
+        fig1 = grafico_lineas(
+            df_filtered, clave_filtro, col_num, color_col, 'sum',
+            f"Número de compraventas de {tipo_producto}s", 'Nº Operaciones', modo_render
         )
         st.plotly_chart(fig1, use_container_width=True)
 
     with tab2:
         if col_pm2 in df_filtered.columns:
-            fig2 = px.line(
-                df_filtered, 
-                x='periodo_dt', 
-                y=col_pm2, 
-                color=color_col,
-                title=f"Precio medio m² de {tipo_producto}s",
-                labels={col_pm2: 'Precio €/m²', 'periodo_dt': 'Fecha'},
-                markers=True,
-                template="plotly_white"
+            fig2 = grafico_lineas(
+                df_filtered, clave_filtro, col_pm2, color_col, 'mean',
+                f"Precio medio m² de {tipo_producto}s", 'Precio €/m²', modo_render
             )
             st.plotly_chart(fig2, use_container_width=True)
         else:
             st.warning("No hay datos de precio m² para esta selección.")
 
     with tab3:
-        st.dataframe(df_filtered.sort_values(['ano', 'trim'], ascending=False), use_container_width=True)
+        # periodo_cod solo sirve para ordenar, no se muestra
+        st.dataframe(df_filtered.drop(columns='periodo_cod'), use_container_width=True)
 
 else:
-    st.warning("Cargando datos... Si el error persiste, comprueba que 'datos.csv' esté en la carpeta principal de tu GitHub.")
+    st.warning("Cargando datos... Si el error persiste, comprueba que 'datos.parquet' esté en la carpeta principal de tu GitHub (para regenerarlo desde un CSV: 'python convertir_datos.py ruta/al/archivo.csv').")
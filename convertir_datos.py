@@ -0,0 +1,62 @@
+import sys
+import pyarrow as pa
+from pyarrow import csv as pacsv
+import pyarrow.parquet as pq
+
+# ------------------------------------------------------
+# CONVERSIÓN DEL CSV ORIGINAL A datos.parquet
+# ------------------------------------------------------
+# La aplicación solo lee datos.parquet, que es el único archivo de datos del
+# repositorio. Para actualizarlo con un CSV nuevo (formato español: punto y
+# coma y decimales con coma) se ejecuta una vez:
+#
+#   python convertir_datos.py ruta/al/archivo.csv
+#
+# y se sube el datos.parquet generado
+
+ARCHIVO_PARQUET = "datos.parquet"
+
+# Columnas que usa la aplicación y su tipo: los códigos de territorio
+# (cod-ca, cod-prv) no se guardan. Los textos repetidos se guardan como
+# diccionario (categorías). Los números de operaciones e importes son enteros
+# y caben exactos en float32; los precios por m² tienen dos decimales y se
+# guardan en float64 para que se sigan viendo tal cual (1187.94, no 1187.9399)
+DTYPES = {
+    'ano': pa.int16(),
+    'trim': pa.int8(),
+    'geo': pa.dictionary(pa.int32(), pa.string()),
+    'ca': pa.dictionary(pa.int32(), pa.string()),
+    'prv': pa.dictionary(pa.int32(), pa.string()),
+    'viv-num': pa.float32(),
+    'viv-imp': pa.float32(),
+    'viv-pm2': pa.float64(),
+    'gar-num': pa.float32(),
+    'gar-imp': pa.float32(),
+    'gar-pm2': pa.float64(),
+    'tras-num': pa.float32(),
+    'tras-imp': pa.float32(),
+    'tras-pm2': pa.float64(),
+}
+
+
+def convertir(ruta_csv, ruta_parquet=ARCHIVO_PARQUET):
+    # Leemos el CSV con el formato español (punto y coma y decimales con coma)
+    tabla = pacsv.read_csv(
+        ruta_csv,
+        parse_options=pacsv.ParseOptions(delimiter=';'),
+        convert_options=pacsv.ConvertOptions(
+            decimal_point=',',
+            column_types=DTYPES,
+            include_columns=list(DTYPES),
+        ),
+    )
+    pq.write_table(tabla, ruta_parquet, compression='zstd')
+    return tabla.num_rows
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("Uso: python convertir_datos.py ruta/al/archivo.csv")
+    ruta_csv = sys.argv[1]
+    filas = convertir(ruta_csv)
+    print(f"Generado '{ARCHIVO_PARQUET}' con {filas} filas a partir de '{ruta_csv}'.")